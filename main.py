@@ -2,21 +2,23 @@ import streamlit as st
 import os
 import time
 import pandas as pd
+import numpy as np
 import re
 import json
-import matplotlib.pyplot as plt
-import seaborn as sns
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime
-import plotly.express as px
-import plotly.graph_objects as go
-from pygments import highlight
-from pygments.lexers import get_lexer_by_name
-from pygments.formatters import HtmlFormatter
 from dotenv import load_dotenv
 import subprocess
 import tempfile
 import traceback
+from collections import Counter, deque
+from itertools import chain, islice
+import hashlib
+import shelve
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables
 load_dotenv()
@@ -24,9 +26,13 @@ load_dotenv()
 # Set page configuration
 st.set_page_config(page_title="Programming TA", page_icon="💻", layout="wide")
 
+# Caps on stored feedback so long-running sessions don't grow without bound
+FEEDBACK_HISTORY_LIMIT = 1000
+SUBMISSIONS_PER_STUDENT_LIMIT = 200
+
 # Initialize session state variables if they don't exist
 if 'feedback_history' not in st.session_state:
-    st.session_state.feedback_history = []
+    st.session_state.feedback_history = deque(maxlen=FEEDBACK_HISTORY_LIMIT)
 if 'student_profiles' not in st.session_state:
     st.session_state.student_profiles = {}
 if 'current_student' not in st.session_state:
@@ -35,6 +41,24 @@ if 'submissions' not in st.session_state:
     st.session_state.submissions = {}
 if 'execution_output' not in st.session_state:
     st.session_state.execution_output = None
+if 'pending_submissions' not in st.session_state:
+    st.session_state.pending_submissions = []
+if 'recorded_submissions' not in st.session_state:
+    st.session_state.recorded_submissions = 0
+if 'session_token' not in st.session_state:
+    st.session_state.session_token = uuid.uuid4().hex
+
+
+# Empty student profile. History and progress are stored column-wise (dict of lists)
+# so they can be handed to pandas/numpy without per-row conversion.
+def new_student_profile():
+    return {
+        "history": {"timestamp": [], "assignment": [], "grade_estimate": [], "key_issues": []},
+        "submissions": 0,
+        "common_issues": {},
+        "strengths": {},
+        "progress": {"timestamp": [], "assignment": [], "grade": []}
+    }
 
 
 # Groq API configuration
@@ -45,14 +69,51 @@ def get_groq_api_key():
     return api_key
 
 
+GROQ_MODEL = "llama3-70b-8192"  # Using Llama 3.3 via Groq
+# Bump whenever the prompt template changes to invalidate cached feedback
+PROMPT_VERSION = "1"
+GROQ_CACHE_PATH = ".groq_cache"
+STREAM_REFRESH_SECONDS = 0.5
+
+
+# Shared HTTP session so Groq calls reuse pooled keep-alive connections
+@st.cache_resource
+def get_groq_session(api_key):
+    session = requests.Session()
+    session.headers.update({
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    })
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    return session
+
+
+# Pygments lexers, the formatter and its CSS are reused across calls; pygments is
+# imported lazily so pages that never show code don't pay for it
+@st.cache_resource
+def _get_lexer(language):
+    from pygments.lexers import get_lexer_by_name
+    return get_lexer_by_name(language)
+
+
+@st.cache_resource
+def _get_formatter():
+    from pygments.formatters import HtmlFormatter
+    return HtmlFormatter(style="default", linenos=True)
+
+
+@st.cache_resource
+def _get_code_css():
+    return f"<style>{_get_formatter().get_style_defs('.highlight')}</style>"
+
+
 # Function to format code with syntax highlighting
+@st.cache_data(show_spinner=False, max_entries=256, ttl=24 * 60 * 60)
 def format_code(code, language):
     try:
-        lexer = get_lexer_by_name(language)
-        formatter = HtmlFormatter(style="default", linenos=True)
-        result = highlight(code, lexer, formatter)
-        css = formatter.get_style_defs('.highlight')
-        return f"<style>{css}</style>{result}"
+        from pygments import highlight
+        result = highlight(code, _get_lexer(language), _get_formatter())
+        return _get_code_css() + result
     except Exception:
         return f"<pre>{code}</pre>"
 
@@ -124,21 +185,13 @@ def execute_code(code, language):
             }
 
 
-# Function to analyze code using Groq API
-def analyze_code(code, language, student_id, assignment_name):
-    api_key = get_groq_api_key()
-    if not api_key:
-        return None
-
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-
-    # Get student's history for context
+# Build the analysis prompt, including the student's recent feedback for context
+def build_prompt(code, language, student_id, assignment_name):
+    # Get student's last three history entries for context
     student_history = []
     if student_id in st.session_state.student_profiles:
-        student_history = st.session_state.student_profiles[student_id].get("history", [])
+        history = st.session_state.student_profiles[student_id]["history"]
+        student_history = [dict(zip(history, row)) for row in zip(*(column[-3:] for column in history.values()))]
 
     # Format prompt for the LLM
     prompt = f"""
@@ -149,7 +202,7 @@ def analyze_code(code, language, student_id, assignment_name):
     STUDENT INFORMATION:
     - Student ID: {student_id}
     - Assignment: {assignment_name}
-    - Previous feedback patterns: {json.dumps(student_history[-3:] if len(student_history) > 0 else [])}
+    - Previous feedback patterns: {json.dumps(student_history)}
 
     CODE:
     ```{language}
@@ -185,102 +238,275 @@ def analyze_code(code, language, student_id, assignment_name):
 
     Only respond with the JSON. Do not include any other text in your response.
     """
+    return prompt
+
+
+_FENCE_RE = re.compile(r'```(?:json)?')
 
+
+# Parse the model's answer, stripping markdown fences if it isn't plain JSON.
+# Returns (feedback_json, error, raw_response).
+def _parse_feedback(feedback):
+    try:
+        return json.loads(feedback), None, None
+    except json.JSONDecodeError:
+        pass
+
+    feedback = _FENCE_RE.sub('', feedback).strip()
     try:
-        response = requests.post(
+        return json.loads(feedback), None, None
+    except json.JSONDecodeError as e:
+        return None, f"Error parsing JSON response: {e}", feedback
+
+
+# Network portion of the analysis; no st.* calls so it is safe to run in worker threads.
+# When on_chunk is given the response is streamed and on_chunk receives the text accumulated
+# so far. Groq's JSON mode doesn't support streaming, so only non-streamed requests use it.
+# Returns (feedback_json, error, raw_response).
+def _analyze_one(session, prompt, on_chunk=None):
+    stream = on_chunk is not None
+    payload = {
+        "model": GROQ_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.2
+    }
+    if stream:
+        payload["stream"] = True
+    else:
+        payload["response_format"] = {"type": "json_object"}
+
+    try:
+        response = session.post(
             "https://api.groq.com/openai/v1/chat/completions",
-            headers=headers,
-            json={
-                "model": "llama3-70b-8192",  # Using Llama 3.3 via Groq
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.2
-            },
-            timeout=60
+            json=payload,
+            timeout=60,
+            stream=stream
         )
 
-        if response.status_code == 200:
-            result = response.json()
-            feedback = result["choices"][0]["message"]["content"]
-
-            # Clean up the response to ensure valid JSON
-            feedback = re.sub(r'```json', '', feedback)
-            feedback = re.sub(r'```', '', feedback)
-            feedback = feedback.strip()
-
-            try:
-                feedback_json = json.loads(feedback)
-
-                # Add timestamp
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                feedback_json["timestamp"] = timestamp
-                feedback_json["language"] = language
-                feedback_json["assignment"] = assignment_name
-
-                # Update student profile and history
-                if student_id not in st.session_state.student_profiles:
-                    st.session_state.student_profiles[student_id] = {
-                        "history": [],
-                        "submissions": 0,
-                        "common_issues": {},
-                        "strengths": {},
-                        "progress": []
-                    }
-
-                profile = st.session_state.student_profiles[student_id]
-                profile["submissions"] += 1
-                profile["history"].append({
-                    "timestamp": timestamp,
-                    "assignment": assignment_name,
-                    "grade_estimate": feedback_json["grade_estimate"],
-                    "key_issues": [issue["description"] for issue in feedback_json.get("logic_errors", [])] +
-                                  [issue["concept"] for issue in feedback_json.get("conceptual_misunderstandings", [])]
-                })
-
-                # Track progress
-                profile["progress"].append({
-                    "timestamp": timestamp,
-                    "assignment": assignment_name,
-                    "grade": int(feedback_json["grade_estimate"].split("/")[0]) if "/" in feedback_json[
-                        "grade_estimate"] else
-                    int(re.search(r'\d+', feedback_json["grade_estimate"]).group()) if re.search(r'\d+', feedback_json[
-                        "grade_estimate"]) else 0
-                })
-
-                # Store submission
-                if student_id not in st.session_state.submissions:
-                    st.session_state.submissions[student_id] = []
-
-                st.session_state.submissions[student_id].append({
-                    "code": code,
-                    "language": language,
-                    "assignment": assignment_name,
-                    "feedback": feedback_json,
-                    "timestamp": timestamp
-                })
-
-                # Add to feedback history
-                st.session_state.feedback_history.append({
-                    "student_id": student_id,
-                    "assignment": assignment_name,
-                    "timestamp": timestamp,
-                    "grade_estimate": feedback_json["grade_estimate"]
-                })
-
-                return feedback_json
-            except json.JSONDecodeError as e:
-                st.error(f"Error parsing JSON response: {e}")
-                st.code(feedback)
-                return None
-        else:
-            st.error(f"API Error: {response.status_code} - {response.text}")
-            return None
+        with response:
+            if response.status_code != 200:
+                return None, f"API Error: {response.status_code} - {response.text}", None
+
+            if not stream:
+                return _parse_feedback(response.json()["choices"][0]["message"]["content"])
+
+            # Server-sent events: each "data: " line carries a JSON chunk with a content delta
+            feedback = ""
+            for line in response.iter_lines():
+                if not line.startswith(b"data: "):
+                    continue
+                data = line[len(b"data: "):]
+                if data == b"[DONE]":
+                    break
+                chunk = json.loads(data)
+                if chunk.get("error"):
+                    error = chunk["error"]
+                    message = error.get("message", error) if isinstance(error, dict) else error
+                    return None, f"API Error: {message}", feedback or None
+                choices = chunk.get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content") or ""
+                if delta:
+                    feedback += delta
+                    on_chunk(feedback)
+
+        return _parse_feedback(feedback)
     except Exception as e:
-        st.error(f"Error calling Groq API: {e}")
+        return None, f"Error calling Groq API: {e}", None
+
+
+_GRADE_RE = re.compile(r'(\d+)')
+
+
+# Turn a grade estimate such as 85, "85/100" or "Grade: 85/100" into an int; 0 if a string has
+# no number in it. Other types raise so record_analysis reports the malformed response.
+def _parse_grade(grade_estimate):
+    if isinstance(grade_estimate, bool):
+        raise TypeError(f"grade_estimate must be a number or string, not {grade_estimate!r}")
+    if isinstance(grade_estimate, (int, float)):
+        return int(grade_estimate)
+    if not isinstance(grade_estimate, str):
+        raise TypeError(f"grade_estimate must be a number or string, not {type(grade_estimate).__name__}")
+    match = _GRADE_RE.search(grade_estimate)
+    return int(match.group(1)) if match else 0
+
+
+# Persistent cache of Groq feedback so identical resubmissions skip the API call
+def _feedback_cache_key(code, language):
+    return hashlib.sha256(f"{PROMPT_VERSION}|{GROQ_MODEL}|{language}|{code}".encode()).hexdigest()
+
+
+# shelve/dbm doesn't support concurrent access and every browser session runs on its own
+# thread, so all cache access goes through one process-wide lock
+@st.cache_resource
+def _get_feedback_cache_lock():
+    return threading.Lock()
+
+
+# Any cache I/O error is treated as a miss
+def get_cached_feedback(code, language):
+    try:
+        with _get_feedback_cache_lock(), shelve.open(GROQ_CACHE_PATH) as cache:
+            return cache.get(_feedback_cache_key(code, language))
+    except Exception:
         return None
 
 
+# Any cache I/O error just skips the write
+def cache_feedback(code, language, feedback_json):
+    try:
+        with _get_feedback_cache_lock(), shelve.open(GROQ_CACHE_PATH) as cache:
+            cache[_feedback_cache_key(code, language)] = feedback_json
+    except Exception:
+        pass
+
+
+# Store an analyzed submission in the student profile, submissions and feedback history
+def _record_submission(student_id, code, language, assignment_name, feedback_json, timestamp):
+    # Derive everything that can fail first, so a malformed response never leaves the
+    # column-wise history/progress lists with different lengths
+    grade_estimate = feedback_json["grade_estimate"]
+    grade = _parse_grade(grade_estimate)
+    key_issues = [
+        *(str(issue["description"]) for issue in feedback_json.get("logic_errors", ())),
+        *(str(issue["concept"]) for issue in feedback_json.get("conceptual_misunderstandings", ()))
+    ]
+
+    feedback_json["timestamp"] = timestamp
+    feedback_json["language"] = language
+    feedback_json["assignment"] = assignment_name
+
+    # Update student profile and history
+    profile = st.session_state.student_profiles.setdefault(student_id, new_student_profile())
+    profile["submissions"] += 1
+    history = profile["history"]
+    history["timestamp"].append(timestamp)
+    history["assignment"].append(assignment_name)
+    history["grade_estimate"].append(grade_estimate)
+    history["key_issues"].append(key_issues)
+
+    # Track progress
+    progress = profile["progress"]
+    progress["timestamp"].append(timestamp)
+    progress["assignment"].append(assignment_name)
+    progress["grade"].append(grade)
+
+    # Store submission
+    if student_id not in st.session_state.submissions:
+        st.session_state.submissions[student_id] = deque(maxlen=SUBMISSIONS_PER_STUDENT_LIMIT)
+
+    st.session_state.submissions[student_id].append({
+        "id": st.session_state.recorded_submissions,
+        "code": code,
+        "language": language,
+        "assignment": assignment_name,
+        "feedback": feedback_json,
+        "timestamp": timestamp
+    })
+
+    # Add to feedback history
+    st.session_state.feedback_history.append({
+        "student_id": student_id,
+        "assignment": assignment_name,
+        "timestamp": timestamp,
+        "grade_estimate": grade_estimate
+    })
+    # Monotonic counter used to key cached views of the recorded data
+    st.session_state.recorded_submissions += 1
+
+    return feedback_json
+
+
+# Show an analysis error in the UI
+def report_analysis_error(error, raw_response):
+    st.error(error)
+    if raw_response is not None:
+        st.code(raw_response)
+
+
+# Record feedback, reporting a response that doesn't match the expected schema instead of raising.
+# Returns the recorded feedback or None.
+def record_analysis(student_id, code, language, assignment_name, feedback_json, error_prefix=""):
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        return _record_submission(student_id, code, language, assignment_name, feedback_json, timestamp)
+    except (KeyError, TypeError, ValueError, AttributeError, OverflowError) as e:
+        report_analysis_error(f"{error_prefix}Unexpected feedback format: {e!r}", json.dumps(feedback_json, indent=2))
+        return None
+
+
+# Function to analyze code using Groq API. The streamed response and any errors are shown in
+# preview, an st.empty() placeholder; the caller should give it the full width of the page.
+def analyze_code(code, language, student_id, assignment_name, preview=None):
+    api_key = get_groq_api_key()
+    if not api_key:
+        return None
+    if preview is None:
+        preview = st.empty()
+
+    feedback_json = get_cached_feedback(code, language)
+    fresh = feedback_json is None
+    if fresh:
+        prompt = build_prompt(code, language, student_id, assignment_name)
+        # Show the response live while it streams in. Each refresh re-sends the whole text,
+        # so refresh at most every STREAM_REFRESH_SECONDS rather than on every token.
+        last_refresh = [0.0]
+
+        def show_partial(text):
+            now = time.monotonic()
+            if now - last_refresh[0] >= STREAM_REFRESH_SECONDS:
+                last_refresh[0] = now
+                preview.code(text, language="json")
+
+        feedback_json, error, raw_response = _analyze_one(get_groq_session(api_key), prompt, on_chunk=show_partial)
+        preview.empty()
+        if error:
+            with preview.container():
+                report_analysis_error(error, raw_response)
+            return None
+
+    with preview.container():
+        recorded = record_analysis(student_id, code, language, assignment_name, feedback_json)
+    # Only cache feedback once it has been recorded successfully
+    if fresh and recorded is not None:
+        cache_feedback(code, language, recorded)
+    return recorded
+
+
+# Analyze several (code, language, student_id, assignment_name) submissions concurrently.
+# Results are returned in input order; failed analyses are None.
+def analyze_code_batch(items):
+    api_key = get_groq_api_key()
+    if not api_key:
+        return [None] * len(items)
+
+    # Cache lookups, prompts and the session stay on the main thread, only the Groq calls fan out
+    session = get_groq_session(api_key)
+    cached = [get_cached_feedback(item[0], item[1]) for item in items]
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        futures = [None if feedback_json is not None else executor.submit(_analyze_one, session, build_prompt(*item))
+                   for item, feedback_json in zip(items, cached)]
+        results = [(feedback_json, None, None) if future is None else future.result()
+                   for feedback_json, future in zip(cached, futures)]
+
+    feedbacks = []
+    for (code, language, student_id, assignment_name), future, (feedback_json, error, raw_response) in zip(
+            items, futures, results):
+        if error:
+            report_analysis_error(f"{student_id} / {assignment_name}: {error}", raw_response)
+            feedbacks.append(None)
+            continue
+        recorded = record_analysis(student_id, code, language, assignment_name, feedback_json,
+                                   error_prefix=f"{student_id} / {assignment_name}: ")
+        if recorded is not None and future is not None:
+            cache_feedback(code, language, recorded)
+        feedbacks.append(recorded)
+    return feedbacks
+
+
 # Student analytics interface
 def display_student_analytics():
+    import plotly.express as px
+
     st.header("Student Analytics Dashboard")
 
     if not st.session_state.current_student:
@@ -289,31 +515,34 @@ def display_student_analytics():
 
     student_id = st.session_state.current_student
 
-    if student_id not in st.session_state.student_profiles or not st.session_state.student_profiles[student_id]["history"]:
+    if student_id not in st.session_state.student_profiles or not st.session_state.student_profiles[student_id]["history"]["timestamp"]:
         st.info("No data available for this student yet")
         return
 
     profile = st.session_state.student_profiles[student_id]
+    grades = profile["progress"]["grade"]
 
     # Overview metrics
     col1, col2, col3 = st.columns(3)
     with col1:
         st.metric("Total Submissions", profile["submissions"])
     with col2:
-        if profile["progress"]:
-            latest_grade = profile["progress"][-1]["grade"]
+        if grades:
+            latest_grade = grades[-1]
             st.metric("Latest Grade", f"{latest_grade}/100")
     with col3:
-        if len(profile["progress"]) > 1:
-            first_grade = profile["progress"][0]["grade"]
-            latest_grade = profile["progress"][-1]["grade"]
+        if len(grades) > 1:
+            first_grade = grades[0]
+            latest_grade = grades[-1]
             improvement = latest_grade - first_grade
             st.metric("Overall Improvement", f"{improvement} points", delta=improvement)
 
     # Progress over time
     st.subheader("Grade Progress")
-    if profile["progress"]:
-        progress_df = pd.DataFrame(profile["progress"])
+    if grades:
+        progress = profile["progress"]
+        progress_df = pd.DataFrame({"timestamp": progress["timestamp"],
+                                    "grade": np.asarray(progress["grade"], dtype=np.int32)})
         fig = px.line(progress_df, x="timestamp", y="grade", markers=True,
                       labels={"timestamp": "Submission Date", "grade": "Grade"},
                       title="Grade Progress Over Time")
@@ -322,28 +551,15 @@ def display_student_analytics():
 
     # Submission history
     st.subheader("Submission History")
-    if profile["history"]:
-        history_df = pd.DataFrame(profile["history"])
-
-        # Get unique key issues
-        all_issues = []
-        for entry in profile["history"]:
-            all_issues.extend(entry.get("key_issues", []))
-
-        # Count issue occurrences
-        issue_counts = {}
-        for issue in all_issues:
-            if issue in issue_counts:
-                issue_counts[issue] += 1
-            else:
-                issue_counts[issue] = 1
+    history = profile["history"]
+    if history["timestamp"]:
+        # Count issue occurrences and keep the top 5
+        top_issues = Counter(chain.from_iterable(history["key_issues"])).most_common(5)
 
         # Common issues chart
-        if issue_counts:
+        if top_issues:
             st.subheader("Common Issues")
-            issue_df = pd.DataFrame(
-                {"Issue": list(issue_counts.keys()), "Count": list(issue_counts.values())})
-            issue_df = issue_df.sort_values("Count", ascending=False).head(5)
+            issue_df = pd.DataFrame(top_issues, columns=["Issue", "Count"])
 
             fig = px.bar(issue_df, x="Count", y="Issue", orientation="h",
                          title="Top 5 Most Common Issues")
@@ -351,20 +567,51 @@ def display_student_analytics():
 
         # Submission details
         st.subheader("Recent Submissions")
-        for i, entry in enumerate(reversed(profile["history"])):
-            if i >= 5:  # Show only the 5 most recent submissions
-                break
-
-            with st.expander(f"{entry['assignment']} - {entry['timestamp']}"):
-                st.write(f"**Grade:** {entry['grade_estimate']}")
-                if entry.get("key_issues"):
+        recent = zip(history["assignment"][-5:], history["timestamp"][-5:],
+                     history["grade_estimate"][-5:], history["key_issues"][-5:])
+        for assignment, timestamp, grade_estimate, key_issues in reversed(list(recent)):
+            with st.expander(f"{assignment} - {timestamp}"):
+                st.write(f"**Grade:** {grade_estimate}")
+                if key_issues:
                     st.write("**Key Issues:**")
-                    for issue in entry["key_issues"]:
+                    for issue in key_issues:
                         st.write(f"- {issue}")
 
 
+# Per-student activity table. cache_data is shared across sessions, so the key includes this
+# session's token; grades only change when a submission is recorded, so the recorded-submission
+# counter identifies the profiles' state. _profiles itself is not hashed (leading underscore).
+@st.cache_data(show_spinner=False, max_entries=100)
+def _build_activity_df(session_token, recorded_submissions, _profiles):
+    student_ids, submissions, latest_grades, average_grades = [], [], [], []
+    for student_id, profile in _profiles.items():
+        if profile["progress"]["grade"]:
+            grades = np.asarray(profile["progress"]["grade"], dtype=np.int32)
+            student_ids.append(student_id)
+            submissions.append(profile["submissions"])
+            latest_grades.append(grades[-1])
+            average_grades.append(grades.mean())
+    return pd.DataFrame({
+        "Student ID": student_ids,
+        "Submissions": np.asarray(submissions, dtype=np.int32),
+        "Latest Grade": np.asarray(latest_grades, dtype=np.int32),
+        "Average Grade": np.round(np.asarray(average_grades, dtype=np.float64), 1)
+    })
+
+
+# Ten most recent feedback entries. Feedback history is a bounded, chronological deque that only
+# changes when a submission is recorded, so the recorded-submission counter identifies its state
+# and the most recent entries are simply the last ones.
+@st.cache_data(show_spinner=False, max_entries=100)
+def _build_recent_feedback_df(session_token, recorded_submissions, _feedback_history):
+    history = list(islice(reversed(_feedback_history), 10))
+    return pd.DataFrame.from_records(history, columns=["student_id", "assignment", "timestamp", "grade_estimate"])
+
+
 # Class overview interface
 def display_class_overview():
+    import plotly.express as px
+
     st.header("Class Overview Dashboard")
 
     if not st.session_state.student_profiles:
@@ -382,23 +629,33 @@ def display_class_overview():
     with col2:
         st.metric("Total Submissions", total_submissions)
 
+    # Batch analysis of queued submissions
+    # The status and button are placeholders filled in after the batch runs, so they reflect the
+    # trimmed queue without a rerun (which would also clear any per-submission errors)
+    pending = st.session_state.pending_submissions
+    if pending:
+        pending_status = st.empty()
+        batch_button = st.empty()
+        if batch_button.button("🔍 Batch Analyze All Pending"):
+            with st.spinner(f"Analyzing {len(pending)} submissions..."):
+                feedbacks = analyze_code_batch(pending)
+            st.session_state.pending_submissions = [
+                item for item, feedback in zip(pending, feedbacks) if feedback is None]
+            st.success(f"Analyzed {sum(feedback is not None for feedback in feedbacks)} submission(s)")
+
+        remaining = len(st.session_state.pending_submissions)
+        if remaining:
+            pending_status.info(f"{remaining} submission(s) pending analysis")
+        else:
+            batch_button.empty()
+
     # Student activity
     st.subheader("Student Activity")
 
-    activity_data = []
-    for student_id, profile in st.session_state.student_profiles.items():
-        if profile["progress"]:
-            latest_grade = profile["progress"][-1]["grade"]
-            avg_grade = sum(entry["grade"] for entry in profile["progress"]) / len(profile["progress"])
-            activity_data.append({
-                "Student ID": student_id,
-                "Submissions": profile["submissions"],
-                "Latest Grade": latest_grade,
-                "Average Grade": round(avg_grade, 1)
-            })
-
-    if activity_data:
-        activity_df = pd.DataFrame(activity_data)
+    activity_df = _build_activity_df(st.session_state.session_token, st.session_state.recorded_submissions,
+                                     st.session_state.student_profiles)
+
+    if not activity_df.empty:
         st.dataframe(activity_df.sort_values("Latest Grade", ascending=False), use_container_width=True)
 
         # Grade distribution
@@ -414,8 +671,9 @@ def display_class_overview():
     st.subheader("Recent Feedback")
 
     if st.session_state.feedback_history:
-        history = sorted(st.session_state.feedback_history, key=lambda x: x["timestamp"], reverse=True)[:10]
-        history_df = pd.DataFrame(history)
+        history_df = _build_recent_feedback_df(st.session_state.session_token,
+                                               st.session_state.recorded_submissions,
+                                               st.session_state.feedback_history)
         st.dataframe(history_df, use_container_width=True)
 
 
@@ -445,15 +703,22 @@ def display_code_submission():
 
             code = st.text_area("Code:", height=300, placeholder="Paste your code here...")
 
-            col_analyze, col_run, _ = st.columns([1, 1, 2])
+            col_analyze, col_queue, col_run, _ = st.columns([1, 1, 1, 1])
+            # Full-width area below the buttons for the streamed analysis and its errors
+            analysis_preview = st.empty()
 
             with col_analyze:
                 if st.button("🔍 Analyze Code", use_container_width=True) and code:
                     with st.spinner("Analyzing code..."):
-                        feedback = analyze_code(code, language, student_id, assignment_name)
+                        feedback = analyze_code(code, language, student_id, assignment_name,
+                                                preview=analysis_preview)
                         if feedback:
                             st.success("Analysis complete!")
-                            st.rerun()
+
+            with col_queue:
+                if st.button("➕ Queue for Batch", use_container_width=True) and code:
+                    st.session_state.pending_submissions.append((code, language, student_id, assignment_name))
+                    st.success("Added to batch queue")
 
             with col_run:
                 if st.button("▶️ Run Code", use_container_width=True) and code:
@@ -494,11 +759,10 @@ def display_code_submission():
 
         if student_id in st.session_state.submissions and len(st.session_state.submissions[student_id]) > 0:
             submissions = st.session_state.submissions[student_id]
-            submission_options = [f"{sub['assignment']} - {sub['timestamp']}" for sub in submissions]
-
-            selected_submission = st.selectbox("Select submission:", submission_options,
-                                               index=len(submission_options) - 1)
-            selected_index = submission_options.index(selected_submission)
+            # Select by position: batch results can share an assignment and timestamp label
+            selected_index = st.selectbox(
+                "Select submission:", range(len(submissions)), index=len(submissions) - 1,
+                format_func=lambda i: f"{submissions[i]['assignment']} - {submissions[i]['timestamp']}")
 
             submission = submissions[selected_index]
             feedback = submission["feedback"]
@@ -581,7 +845,9 @@ def display_code_submission():
             with code_tab:
                 st.markdown(f"**Language:** {submission['language']}")
                 st.markdown(f"**Assignment:** {submission['assignment']}")
-                st.markdown(format_code(submission["code"], submission["language"]), unsafe_allow_html=True)
+                # Tabs render eagerly, so only highlight the code once the user asks for it
+                if st.toggle("Show formatted code", key=f"show_code_{submission['id']}"):
+                    st.markdown(format_code(submission["code"], submission["language"]), unsafe_allow_html=True)
         else:
             st.info("No submissions found for this student")
 
@@ -611,13 +877,7 @@ def main():
         new_student = st.text_input("Add new student ID:")
         if st.button("Add Student") and new_student:
             if new_student not in st.session_state.student_profiles:
-                st.session_state.student_profiles[new_student] = {
-                    "history": [],
-                    "submissions": 0,
-                    "common_issues": {},
-                    "strengths": {},
-                    "progress": []
-                }
+                st.session_state.student_profiles[new_student] = new_student_profile()
                 st.success(f"Added student: {new_student}")
             else:
                 st.warning(f"Student {new_student} already exists")
@@ -625,10 +885,8 @@ def main():
         # Select existing student
         students = list(st.session_state.student_profiles.keys())
         if students:
-            selected_student = st.selectbox("Select Student:", options=students)
-            if selected_student != st.session_state.current_student:
-                st.session_state.current_student = selected_student
-                st.rerun()
+            # The sidebar renders before the main content, so this run already sees the selection
+            st.session_state.current_student = st.selectbox("Select Student:", options=students)
         else:
             st.info("No students added yet")
 